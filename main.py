@@ -1,9 +1,14 @@
+import argparse
+import csv
+import os
 import sqlite3
+import sys
 import threading
+import weakref
 import logging
-from dataclasses import dataclass
-from typing import List, Optional
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Iterable, Iterator, List, Optional
 import re
 from tabulate import tabulate
 from datetime import datetime
@@ -11,36 +16,132 @@ from datetime import datetime
 # logging configuration level of the data
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# email validation pattern, compiled once for the whole module
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+# error message prefixes for failed inserts
+_ERR_DB = "Database error: "
+_ERR_UNEX = "Unexpected error: "
+# errors a single row can raise while it is bound and written; the batch is rolled
+# back and its rows retried one by one so only the bad row fails
+_ROW_ERRORS = (sqlite3.Error, OverflowError, ValueError)
+
+# users, products and orders all live in this one database file
+DB_PATH = 'app.db'
+_INSERT_USER = 'INSERT INTO users (id, name, email) VALUES (?, ?, ?)'
+_INSERT_PRODUCT = 'INSERT INTO products (id, name, price) VALUES (?, ?, ?)'
+_INSERT_ORDER = 'INSERT INTO orders (id, user_id, product_id, quantity) VALUES (?, ?, ?, ?)'
+TABLES = ('users', 'products', 'orders')
+# columns copied over from the pre-app.db per-table files (users.db, products.db, orders.db)
+LEGACY_COLUMNS = {
+    'users': 'id, name, email',
+    'products': 'id, name, price',
+    'orders': 'id, user_id, product_id, quantity',
+}
+
+# connection settings; busy_timeout, synchronous, temp_store and cache_size
+# only last for the connection, so every connect() has to apply them again
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+def connect(db_path: str) -> sqlite3.Connection:
+    # autocommit mode; batches open their own transactions with an explicit BEGIN
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _close_connections(connections: list, connections_lock: threading.Lock):
+    with connections_lock:
+        for conn in connections:
+            conn.close()
+        connections.clear()
+
 # Data model for User
-@dataclass
+@dataclass(slots=True)
 class User:
     id: int
     name: str
     email: str
 
 # Data model for Product
-@dataclass
+@dataclass(slots=True)
 class Product:
     id: int
     name: str
     price: float
 
 # Data model for Order
-@dataclass
+@dataclass(slots=True)
 class Order:
     id: int
     user_id: int
     product_id: int
     quantity: int
 
+# Struct-of-arrays layout of users for the bulk path; iterating it yields
+# (id, name, email) rows, which user_rows streams into executemany
+@dataclass(slots=True)
+class UserBatch:
+    ids: List[int] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    emails: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_users(cls, users: List[User]) -> 'UserBatch':
+        return cls(
+            [user.id for user in users],
+            [user.name for user in users],
+            [user.email for user in users]
+        )
+
+    def __iter__(self):
+        return zip(self.ids, self.names, self.emails)
+
 class DatabaseManager:
     def __init__(self):
+        # one long-lived connection per thread
+        self._tls = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # closes the pooled connections when the manager is garbage collected or at exit,
+        # without keeping the manager itself alive
+        self._finalizer = weakref.finalize(
+            self, _close_connections, self._connections, self._connections_lock
+        )
         self.setup_databases()
+        # all tables share one database file, and SQLite allows one writer per file
         self.lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, 'conn', None)
+        if conn is None:
+            conn = self._tls.conn = connect(DB_PATH)
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    # one reusable cursor per thread; the INSERT statements stay prepared in the
+    # connection's statement cache between batches
+    def _cursor(self) -> sqlite3.Cursor:
+        cursor = getattr(self._tls, 'cursor', None)
+        if cursor is None:
+            cursor = self._tls.cursor = self._conn().cursor()
+        return cursor
+
+    def close(self):
+        _close_connections(self._connections, self._connections_lock)
+        self._tls = threading.local()
         
     def setup_databases(self):
-        # Create users database with the setup sqlite for the user
-        with sqlite3.connect('users.db') as conn:
+        # Create the users, products and orders tables in the one database file
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY,
@@ -48,9 +149,6 @@ class DatabaseManager:
                     email TEXT UNIQUE NOT NULL
                 )
             ''')
-            
-        # CCreate users database with the setup sqlite for the product
-        with sqlite3.connect('products.db') as conn:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS products (
                     id INTEGER PRIMARY KEY,
@@ -58,17 +156,56 @@ class DatabaseManager:
                     price REAL NOT NULL
                 )
             ''')
-            
-        # Create users database with the setup sqlite for the order
-        with sqlite3.connect('orders.db') as conn:
+            # foreign keys are declared for the schema but not enforced (PRAGMA foreign_keys
+            # stays off), so orders keep being accepted exactly as they were before
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS orders (
                     id INTEGER PRIMARY KEY,
-                    user_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL REFERENCES users(id),
+                    product_id INTEGER NOT NULL REFERENCES products(id),
                     quantity INTEGER NOT NULL
                 )
             ''')
+            # product names repeat in the data (two "Laptop" rows), so this index is not UNIQUE
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_product ON orders(product_id)')
+        self._import_legacy_databases()
+
+    # The tables used to live in users.db, products.db and orders.db; copy their rows
+    # into the shared database once, recorded in PRAGMA user_version
+    def _import_legacy_databases(self):
+        conn = self._conn()
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= 1:
+            return
+        attached = []
+        try:
+            # ATTACH is not allowed inside a transaction, so attach everything first
+            for table in TABLES:
+                legacy_path = f'{table}.db'
+                if os.path.exists(legacy_path):
+                    conn.execute(f'ATTACH DATABASE ? AS legacy_{table}', (legacy_path,))
+                    attached.append(table)
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                # another process may have finished the import while we waited for the lock
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= 1:
+                    return
+                for table in attached:
+                    exists = conn.execute(
+                        f"SELECT 1 FROM legacy_{table}.sqlite_master WHERE type = 'table' AND name = ?",
+                        (table,)
+                    ).fetchone()
+                    if exists:
+                        columns = LEGACY_COLUMNS[table]
+                        conn.execute(
+                            f'INSERT OR IGNORE INTO main.{table} ({columns}) '
+                            f'SELECT {columns} FROM legacy_{table}.{table}'
+                        )
+                conn.execute('PRAGMA user_version = 1')
+        finally:
+            for table in attached:
+                conn.execute(f'DETACH DATABASE legacy_{table}')
 
     def validate_user(self, user: User) -> Optional[str]:
         if not user.name or not isinstance(user.name, str):
@@ -76,8 +213,7 @@ class DatabaseManager:
         if not user.email or not isinstance(user.email, str):
             return "Invalid email"
         # This is the email validation validation code 
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, user.email):
+        if not _EMAIL_RE.match(user.email):
             return "Invalid email format"
         return None
 
@@ -97,78 +233,188 @@ class DatabaseManager:
             return "Invalid user_id or product_id"
         return None
 
-    def insert_user(self, user: User) -> tuple[bool, str]:
-        error = self.validate_user(user)
-        if error:
-            return False, error
-        
-        try:
-            with self.lock, sqlite3.connect('users.db') as conn:
-                conn.execute(
-                    'INSERT INTO users (id, name, email) VALUES (?, ?, ?)',
-                    (user.id, user.name, user.email)
-                )
-                return True, "Success"
-        except sqlite3.IntegrityError as e:
-            return False, f"Database error: {str(e)}"
-        except Exception as e:
-            return False, f"Unexpected error: {str(e)}"
+    # Batch validators: one pass over the list, done before the write lock is taken.
+    # Each returns (source, errors): the source the row generator below reads from and
+    # the rejects as {position: reason}. The common valid case is checked inline; only
+    # rejected rows go through validate_* for the reason.
+    def validate_users_batch(self, users: List[User]) -> tuple[UserBatch, dict]:
+        batch = UserBatch.from_users(users)
+        errors = {}
+        match = _EMAIL_RE.match
+        for i, (name, email) in enumerate(zip(batch.names, batch.emails)):
+            if not (name and isinstance(name, str) and email and isinstance(email, str)
+                    and match(email)):
+                errors[i] = self.validate_user(users[i])
+        return batch, errors
 
-    def insert_product(self, product: Product) -> tuple[bool, str]:
-        error = self.validate_product(product)
-        if error:
-            return False, error
-        
+    def validate_products_batch(self, products: List[Product]) -> tuple[List[Product], dict]:
+        errors = {}
+        for i, product in enumerate(products):
+            price = product.price
+            if not (product.name and isinstance(product.name, str) and isinstance(price, (int, float))
+                    and not price < 0):
+                errors[i] = self.validate_product(product)
+        return products, errors
+
+    def validate_orders_batch(self, orders: List[Order]) -> tuple[List[Order], dict]:
+        errors = {}
+        for i, order in enumerate(orders):
+            if order.quantity < 0 or order.user_id < 1 or order.product_id < 1:
+                errors[i] = self.validate_order(order)
+        return orders, errors
+
+    # Row generators: yield the already validated rows straight into executemany,
+    # skipping the positions in errors
+    def user_rows(self, batch: UserBatch, errors: dict) -> Iterator[tuple]:
+        for i, row in enumerate(batch):
+            if i not in errors:
+                yield row
+
+    def product_rows(self, products: List[Product], errors: dict) -> Iterator[tuple]:
+        for i, product in enumerate(products):
+            if i not in errors:
+                yield (product.id, product.name, product.price)
+
+    def order_rows(self, orders: List[Order], errors: dict) -> Iterator[tuple]:
+        for i, order in enumerate(orders):
+            if i not in errors:
+                yield (order.id, order.user_id, order.product_id, order.quantity)
+
+    def _insert_row(self, sql: str, row: tuple) -> tuple[bool, str]:
         try:
-            with self.lock, sqlite3.connect('products.db') as conn:
-                conn.execute(
-                    'INSERT INTO products (id, name, price) VALUES (?, ?, ?)',
-                    (product.id, product.name, product.price)
-                )
+            cursor = self._cursor()
+            with self.lock:
+                cursor.execute(sql, row)
                 return True, "Success"
         except sqlite3.IntegrityError as e:
-            return False, f"Database error: {str(e)}"
+            return False, _ERR_DB + str(e)
         except Exception as e:
-            return False, f"Unexpected error: {str(e)}"
+            return False, _ERR_UNEX + str(e)
 
-    def insert_order(self, order: Order) -> tuple[bool, str]:
-        error = self.validate_order(order)
-        if error:
-            return False, error
-        
+    # Writes one or more tables in a single BEGIN IMMEDIATE ... COMMIT. Each entry of
+    # tables is (sql, items, validate_batch, row_source); returns one result list per
+    # entry, each with an (id, success, message) tuple per input item, in input order.
+    def _insert_bulk(self, tables: list) -> List[List[tuple]]:
+        # validate every table before taking the write lock, so only row building runs inside it
+        prepared = [
+            (sql, items, row_source, *validate_batch(items))
+            for sql, items, validate_batch, row_source in tables
+        ]
+        retry = False
         try:
-            with self.lock, sqlite3.connect('orders.db') as conn:
-                conn.execute(
-                    'INSERT INTO orders (id, user_id, product_id, quantity) VALUES (?, ?, ?, ?)',
-                    (order.id, order.user_id, order.product_id, order.quantity)
-                )
-                return True, "Success"
-        except sqlite3.IntegrityError as e:
-            return False, f"Database error: {str(e)}"
+            conn, cursor = self._conn(), self._cursor()
+            with self.lock:
+                # take the write lock up front so the batch never has to upgrade mid-way
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    with conn:
+                        for sql, _, row_source, source, errors in prepared:
+                            cursor.executemany(sql, row_source(source, errors))
+                except _ROW_ERRORS:
+                    retry = True
+            if retry:
+                # one bad row rolls back the whole batch, so retry the valid rows one by one
+                outcomes = [
+                    [self._insert_row(sql, row) for row in row_source(source, errors)]
+                    for sql, _, row_source, source, errors in prepared
+                ]
+            else:
+                outcomes = [repeat((True, "Success"))] * len(prepared)
         except Exception as e:
-            return False, f"Unexpected error: {str(e)}"
-   
+            # failed before any row was written, e.g. BEGIN IMMEDIATE hit busy_timeout
+            outcomes = [repeat((False, _ERR_UNEX + str(e)))] * len(prepared)
+
+        all_results = []
+        for (_, items, _, _, errors), row_outcomes in zip(prepared, outcomes):
+            results = []
+            row_outcomes = iter(row_outcomes)
+            for i, item in enumerate(items):
+                success, message = (False, errors[i]) if i in errors else next(row_outcomes)
+                results.append((item.id, success, message))
+            all_results.append(results)
+        return all_results
+
+    def insert_users_bulk(self, users: List[User]) -> List[tuple]:
+        return self._insert_bulk([
+            (_INSERT_USER, users, self.validate_users_batch, self.user_rows)
+        ])[0]
+
+    def insert_products_bulk(self, products: List[Product]) -> List[tuple]:
+        return self._insert_bulk([
+            (_INSERT_PRODUCT, products, self.validate_products_batch, self.product_rows)
+        ])[0]
+
+    def insert_orders_bulk(self, orders: List[Order]) -> List[tuple]:
+        return self._insert_bulk([
+            (_INSERT_ORDER, orders, self.validate_orders_batch, self.order_rows)
+        ])[0]
+
+    # all three tables in one transaction: one COMMIT, and one fsync, for the workload
+    def insert_all_bulk(self, users: List[User], products: List[Product],
+                        orders: List[Order]) -> tuple[List[tuple], List[tuple], List[tuple]]:
+        user_results, product_results, order_results = self._insert_bulk([
+            (_INSERT_USER, users, self.validate_users_batch, self.user_rows),
+            (_INSERT_PRODUCT, products, self.validate_products_batch, self.product_rows),
+            (_INSERT_ORDER, orders, self.validate_orders_batch, self.order_rows),
+        ])
+        return user_results, product_results, order_results
+
+    # streams a table in chunks of arraysize rows instead of materialising it at once
+    def iter_table(self, table: str, arraysize: int = 1000):
+        if table not in TABLES:
+            raise ValueError(f"Unknown table: {table}")
+        cursor = self._conn().execute(f'SELECT * FROM {table}')
+        while True:
+            rows = cursor.fetchmany(arraysize)
+            if not rows:
+                break
+            yield from rows
 
     #fetching all the data in the database
     def get_all_data(self):
-        users_data = []
-        with sqlite3.connect('users.db') as conn:
-            cursor = conn.execute('SELECT * FROM users')
-            users_data = cursor.fetchall()
-            
-        products_data = []
-        with sqlite3.connect('products.db') as conn:
-            cursor = conn.execute('SELECT * FROM products')
-            products_data = cursor.fetchall()
-            
-        orders_data = []
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.execute('SELECT * FROM orders')
-            orders_data = cursor.fetchall()
-            
+        users_data, products_data, orders_data = (list(self.iter_table(table)) for table in TABLES)
         return users_data, products_data, orders_data
 
-def main():
+# inserts the whole workload in a single BEGIN IMMEDIATE ... COMMIT on the one
+# database, writing users and products before the orders that reference them
+def bulk_insert_all(db_manager: DatabaseManager, users: List[User], products: List[Product],
+                    orders: List[Order]) -> tuple[List[tuple], List[tuple], List[tuple]]:
+    return db_manager.insert_all_bulk(users, products, orders)
+
+# section headings go to stderr in csv mode, so stdout holds nothing but CSV rows
+def print_heading(text: str, fmt: str):
+    print(text, file=sys.stderr if fmt == 'csv' else sys.stdout)
+
+# grid tables for a terminal; CSV when piped, which skips tabulate's column-width pass.
+# In csv mode every table is a '# name' marker line, a header row, the data rows and a
+# blank line, so a reader can split stdout back into its tables
+def print_table(name: str, rows: Iterable, headers: List[str], fmt: str):
+    if fmt == 'csv':
+        sys.stdout.write(f"# {name}\n")
+        writer = csv.writer(sys.stdout)
+        writer.writerow(headers)
+        writer.writerows(rows)
+        sys.stdout.write("\n")
+        return
+    # tabulate measures every row, so only grid output materialises the table
+    rows = list(rows)
+    if rows:
+        print(tabulate(rows, headers=headers, tablefmt='grid'))
+    else:
+        print("(no rows)")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Insert the sample users, products and orders",
+        epilog="csv output holds six tables in turn (users_validation, products_validation, "
+               "orders_validation, users, products, orders). Each one is a '# <table>' line, "
+               "a header row, its data rows and a blank line; section headings go to stderr."
+    )
+    parser.add_argument('--format', choices=['grid', 'csv'], default=None,
+                        help="output format (default: grid on a terminal, csv otherwise)")
+    args = parser.parse_args(argv)
+    fmt = args.format or ('grid' if sys.stdout.isatty() else 'csv')
+
     db_manager = DatabaseManager()
     
     # Sample data
@@ -211,67 +457,30 @@ def main():
         Order(10, 10, 11, 2),
     ]
     
-    # Results storage
-    user_results = []
-    product_results = []
-    order_results = []
-    
-    # Concurrent insertion using ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        # Insert users
-        for user in users:
-            success, message = db_manager.insert_user(user)
-            user_results.append({
-                'id': user.id,
-                'success': success,
-                'message': message
-            })
-            
-        # Insert products
-        for product in products:
-            success, message = db_manager.insert_product(product)
-            product_results.append({
-                'id': product.id,
-                'success': success,
-                'message': message
-            })
-            
-        # Insert orders
-        for order in orders:
-            success, message = db_manager.insert_order(order)
-            order_results.append({
-                'id': order.id,
-                'success': success,
-                'message': message
-            })
-    
-    # Fetch and display results
-    users_data, products_data, orders_data = db_manager.get_all_data()
+    # Insert the whole workload in one transaction
+    user_results, product_results, order_results = bulk_insert_all(db_manager, users, products, orders)
     
     # Display validation results
-    print("\nValidation Data Results:")
-    print("\nUsers  Validation Data:")
-    users_table = [[r['id'], r['success'], r['message']] for r in user_results]
-    print(tabulate(users_table, headers=['ID', 'Success', 'Message'], tablefmt='grid'))
+    print_heading("\nValidation Data Results:", fmt)
+    print_heading("\nUsers  Validation Data:", fmt)
+    print_table('users_validation', user_results, ['ID', 'Success', 'Message'], fmt)
     
-    print("\nProducts Validation Data:")
-    products_table = [[r['id'], r['success'], r['message']] for r in product_results]
-    print(tabulate(products_table, headers=['ID', 'Success', 'Message'], tablefmt='grid'))
+    print_heading("\nProducts Validation Data:", fmt)
+    print_table('products_validation', product_results, ['ID', 'Success', 'Message'], fmt)
     
-    print("\nOrders Validation Data:")
-    orders_table = [[r['id'], r['success'], r['message']] for r in order_results]
-    print(tabulate(orders_table, headers=['ID', 'Success', 'Message'], tablefmt='grid'))
+    print_heading("\nOrders Validation Data:", fmt)
+    print_table('orders_validation', order_results, ['ID', 'Success', 'Message'], fmt)
     
-    # successfully inserted data
-    print("\nSuccessfully Inserted Data in database:")
-    print("\nUsers Data Table:")
-    print(tabulate(users_data, headers=['ID', 'Name', 'Email'], tablefmt='grid'))
+    # successfully inserted data, streamed from the database table by table
+    print_heading("\nSuccessfully Inserted Data in database:", fmt)
+    print_heading("\nUsers Data Table:", fmt)
+    print_table('users', db_manager.iter_table('users'), ['ID', 'Name', 'Email'], fmt)
     
-    print("\nProducts Data Table:")
-    print(tabulate(products_data, headers=['ID', 'Name', 'Price'], tablefmt='grid'))
+    print_heading("\nProducts Data Table:", fmt)
+    print_table('products', db_manager.iter_table('products'), ['ID', 'Name', 'Price'], fmt)
     
-    print("\nOrders  Data Table:")
-    print(tabulate(orders_data, headers=['ID', 'User ID', 'Product ID', 'Quantity'], tablefmt='grid'))
+    print_heading("\nOrders  Data Table:", fmt)
+    print_table('orders', db_manager.iter_table('orders'), ['ID', 'User ID', 'Product ID', 'Quantity'], fmt)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
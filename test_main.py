@@ -0,0 +1,53 @@
+import gc
+import sqlite3
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def db_manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = main.DatabaseManager()
+    yield manager
+    manager.close()
+
+
+def test_product_price_too_large_fails_only_that_row_in_large_batch(db_manager):
+    count = 20_000
+    products = [main.Product(i, f"Product {i}", 10.0) for i in range(1, count + 1)]
+    products[5].price = 10 ** 400
+
+    results = db_manager.insert_products_bulk(products)
+
+    assert len(results) == count
+    product_id, success, message = results[5]
+    assert product_id == 6
+    assert success is False
+    assert message.startswith(main._ERR_UNEX)
+    assert all(result == (i, True, "Success")
+               for i, result in enumerate(results, start=1) if i != 6)
+    assert len(db_manager.get_all_data()[1]) == count - 1
+
+
+def test_product_price_too_large_matches_small_batch(db_manager):
+    products = [main.Product(1, "Laptop", 10 ** 400), main.Product(2, "Mouse", 30.0)]
+
+    results = db_manager.insert_products_bulk(products)
+
+    assert results[0][:2] == (1, False)
+    assert results[0][2].startswith(main._ERR_UNEX)
+    assert results[1] == (2, True, "Success")
+
+
+def test_dropped_manager_closes_its_connections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = main.DatabaseManager()
+    conn = manager._conn()
+
+    del manager
+    gc.collect()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')